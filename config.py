@@ -10,13 +10,21 @@ Dynamic configuration loader for the MES optimization model.
 This module loads parameters from a specified YAML file and makes them available
 as module-level variables for other scripts to import and use.
 """
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, Mapping
+
 import yaml
 
+import utils
+
 # --- Module-level variables to hold the loaded configuration ---
 # These will be populated by the load_config function.
 
 # Simulation Control
 NUM_DAYS = 8
+ENFORCE_STORAGE_EXCLUSIVITY = True
 
 # Economic Parameters
 INTEREST_RATE = 0.08
@@ -37,20 +45,69 @@ BASE_CAPACITIES = {}
 # Component Technical Parameters
 COMPONENT_PARAMS = {}
 
-def load_config(config_path: str):
+@dataclass(frozen=True, slots=True)
+class MESConfig:
+    """An immutable snapshot of one loaded configuration, as returned by load_config."""
+    num_days: int
+    enforce_storage_exclusivity: bool
+    interest_rate: float
+    gas_price_multiplier: float
+    shed_cost_per_mwh: Mapping[str, float]
+    investment_costs: Mapping[str, float]
+    lifetimes: Mapping[str, int]
+    base_capacities: Mapping[str, Any]
+    component_params: Mapping[str, Mapping[str, Any]]
+
+def _read_config_file(config_path: str) -> dict:
+    """
+    Reads a YAML configuration file, reusing a JSON sidecar cache when it is up to date.
+
+    The parsed YAML is written to '<config_path>.cache.json' and reused as long as it
+    is newer than the YAML file itself, so repeated loads in a sweep skip YAML parsing.
+    An unreadable sidecar is ignored. A config that does not survive a JSON round trip
+    unchanged (dates, non-string keys such as {1: 2}) is not cached, so that cached and
+    uncached loads always return the same data.
+    """
+    cache_path = config_path + ".cache.json"
+    if os.path.exists(cache_path) and \
+            os.stat(cache_path).st_mtime_ns > os.stat(config_path).st_mtime_ns:
+        try:
+            with open(cache_path, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Ignoring unreadable config cache {cache_path}: {e}")
+
+    # Prefer the libyaml-backed loader; fall back to the pure-Python one if unavailable.
+    Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    with open(config_path, 'r') as f:
+        config_data = yaml.load(f, Loader=Loader)
+
+    try:
+        config_json = json.dumps(config_data)
+        cacheable = json.loads(config_json) == config_data
+    except (TypeError, ValueError):
+        cacheable = False
+    if cacheable:
+        utils.write_cache_file(cache_path, lambda f: f.write(config_json.encode()))
+    return config_data
+
+def load_config(config_path: str) -> MESConfig:
     """
     Loads configuration from a YAML file and populates the module-level variables.
 
     Args:
         config_path: The absolute or relative path to the YAML configuration file.
+
+    Returns:
+        MESConfig: The loaded configuration. Callers in hot loops should bind its
+        fields to locals rather than re-reading the module-level variables.
     """
-    global NUM_DAYS, INTEREST_RATE, GAS_PRICE_MULTIPLIER, SHED_COST_PER_MWH, \
+    global NUM_DAYS, ENFORCE_STORAGE_EXCLUSIVITY, INTEREST_RATE, GAS_PRICE_MULTIPLIER, SHED_COST_PER_MWH, \
            INVESTMENT_COSTS, LIFETIMES, BASE_CAPACITIES, COMPONENT_PARAMS
 
     print(f"--- Loading configuration from: {config_path} ---")
     try:
-        with open(config_path, 'r') as f:
-            config_data = yaml.safe_load(f)
+        config_data = _read_config_file(config_path)
     except FileNotFoundError:
         print(f"[ERROR] Configuration file not found at: {config_path}")
         raise
@@ -58,23 +115,34 @@ def load_config(config_path: str):
         print(f"[ERROR] Failed to load or parse YAML file: {e}")
         raise
 
-    # Populate module variables from the loaded data
     sim_control = config_data.get('simulation_control', {})
-    NUM_DAYS = sim_control.get('num_days', 8)
-
     econ_params = config_data.get('economic_parameters', {})
-    INTEREST_RATE = econ_params.get('interest_rate', 0.08)
-    GAS_PRICE_MULTIPLIER = econ_params.get('gas_price_multiplier', 1.0)
-
     cost_params = config_data.get('cost_parameters', {})
-    SHED_COST_PER_MWH = cost_params.get('shed_cost_per_mwh', {})
+    cfg = MESConfig(
+        num_days=sim_control.get('num_days', 8),
+        enforce_storage_exclusivity=sim_control.get('enforce_storage_exclusivity', True),
+        interest_rate=econ_params.get('interest_rate', 0.08),
+        gas_price_multiplier=econ_params.get('gas_price_multiplier', 1.0),
+        shed_cost_per_mwh=cost_params.get('shed_cost_per_mwh', {}),
+        investment_costs=config_data.get('investment_costs', {}),
+        lifetimes=config_data.get('lifetimes', {}),
+        base_capacities=config_data.get('base_capacities', {}),
+        component_params=config_data.get('component_params', {}),
+    )
 
-    INVESTMENT_COSTS = config_data.get('investment_costs', {})
-    LIFETIMES = config_data.get('lifetimes', {})
-    BASE_CAPACITIES = config_data.get('base_capacities', {})
-    COMPONENT_PARAMS = config_data.get('component_params', {})
+    # Populate module variables from the loaded data
+    NUM_DAYS = cfg.num_days
+    ENFORCE_STORAGE_EXCLUSIVITY = cfg.enforce_storage_exclusivity
+    INTEREST_RATE = cfg.interest_rate
+    GAS_PRICE_MULTIPLIER = cfg.gas_price_multiplier
+    SHED_COST_PER_MWH = cfg.shed_cost_per_mwh
+    INVESTMENT_COSTS = cfg.investment_costs
+    LIFETIMES = cfg.lifetimes
+    BASE_CAPACITIES = cfg.base_capacities
+    COMPONENT_PARAMS = cfg.component_params
 
     print("Configuration loaded successfully.")
+    return cfg
 
 # Example of loading a default config if this file is run directly (optional)
 if __name__ == '__main__':
@@ -10,59 +10,192 @@ Data loading and processing for the MES optimization model.
 This module reads the time series data from data.csv, handles typical day
 selection, and prepares the data for the optimization model.
 """
+import hashlib
+import os
+
 import pandas as pd
 import numpy as np
 
 # Import configuration
 import config
+import utils
+from numba_kernels import HAS_NUMBA
+if HAS_NUMBA:
+    from numba_kernels import assign_and_score
+
+# Column dtypes of data/data.csv. Pinning them skips pandas' type inference.
+# The index column is an integer hour-of-year counter, not a timestamp.
+DATA_DTYPES = {
+    'elec_load(MW)': np.float64,
+    'heating_load(MW)': np.float64,
+    'cooling_load(MW)': np.float64,
+    'elec_price(HKD/MWh)': np.float64,
+    'gas_price(HKD/m^3)': np.float64,
+}
+
+DATA_PATH = 'data/data.csv'
+TYPICAL_DAYS_CACHE_DIR = '.td_cache'
+
+# Typical-day selections already loaded in this process, keyed like the .npz cache files
+_LOADED_TYPICAL_DAYS = {}
+
+def select_typical_days(daily_profiles: np.ndarray, num_typical_days: int, max_iter: int = 100):
+    """
+    Selects representative days by k-means clustering of daily profiles.
+
+    The features are standardized per column so that loads (MW) and prices (HKD)
+    contribute on a comparable scale. Centroids are seeded with evenly spaced days,
+    which keeps the selection deterministic across runs.
+
+    Args:
+        daily_profiles: Array of shape (num_days, num_features) with one row per day.
+        num_typical_days: The number of clusters (representative days) to form.
+        max_iter: The maximum number of k-means iterations.
+
+    Returns:
+        A tuple containing:
+        - np.ndarray: Sorted indices of the representative (medoid) days.
+        - np.ndarray: The number of days in the cluster of each representative day.
+    """
+    std = daily_profiles.std(axis=0)
+    X = (daily_profiles - daily_profiles.mean(axis=0)) / np.where(std > 0, std, 1.0)
+
+    seed_days = np.linspace(0, len(X) - 1, num_typical_days, dtype=int)
+    centroids = X[seed_days].copy()
+    for _ in range(max_iter):
+        labels, _ = _assign_to_centroids(X, centroids)
+        new_centroids = centroids.copy()
+        for k in range(num_typical_days):
+            members = X[labels == k]
+            if len(members):  # An empty cluster keeps its previous centroid
+                new_centroids[k] = members.mean(axis=0)
+        if np.allclose(new_centroids, centroids):
+            break
+        centroids = new_centroids
+
+    labels, dists = _assign_to_centroids(X, centroids)
+    day_indices, cluster_sizes = [], []
+    for k in range(num_typical_days):
+        members = np.flatnonzero(labels == k)
+        if len(members):
+            day_indices.append(members[np.argmin(dists[members])])
+            cluster_sizes.append(len(members))
+
+    order = np.argsort(day_indices)
+    return np.asarray(day_indices)[order], np.asarray(cluster_sizes)[order]
+
+def _assign_to_centroids(X: np.ndarray, centroids: np.ndarray):
+    """Returns the nearest centroid of each row of X and the squared distance to it."""
+    if HAS_NUMBA:
+        labels = np.empty(len(X), dtype=np.int64)
+        sq_dists = np.empty(len(X))
+        assign_and_score(X, centroids, labels, sq_dists)
+        return labels, sq_dists
+    # Direct differences summed feature by feature, in the numba kernel's order. Other forms
+    # (the |x|^2 - 2x.c + |c|^2 expansion, or a pairwise .sum) round differently and can pick
+    # other medoids, which would make the selection depend on whether numba is installed.
+    sq_dists = np.zeros((len(X), len(centroids)))
+    for j in range(X.shape[1]):
+        diff = X[:, j, None] - centroids[None, :, j]
+        sq_dists += diff * diff
+    labels = sq_dists.argmin(axis=1)
+    return labels, sq_dists[np.arange(len(X)), labels]
+
+def _typical_days_cache_key() -> str:
+    """
+    Hashes everything the typical-day selection depends on: the number of days,
+    the data file's modification time and this module (the selection method).
+    """
+    key_source = f"{config.NUM_DAYS}:{os.stat(DATA_PATH).st_mtime_ns}:{os.stat(__file__).st_mtime_ns}"
+    return hashlib.sha1(key_source.encode()).hexdigest()
 
 def load_and_prepare_data():
     """
     Loads time series data, selects representative days, and calculates weights.
 
+    The result is cached in '.td_cache/<key>.npz', so repeated runs with the same
+    NUM_DAYS and data file skip the CSV parse and the clustering. Within one process
+    the result is also kept in memory; callers must not modify the returned objects.
+
     Returns:
         A tuple containing:
         - pd.DataFrame: DataFrame with data for the selected typical days.
         - np.ndarray: An array of weights for each typical day.
     """
     print("--- Loading and Preparing Data ---")
-    
-    # Load the full 365-day time series data
+
     try:
-        full_data = pd.read_csv('data/data.csv', index_col=0, parse_dates=True)
+        cache_key = _typical_days_cache_key()
     except FileNotFoundError:
-        print("Error: 'data/data.csv' not found. Please ensure the data file exists.")
+        print(f"Error: '{DATA_PATH}' not found. Please ensure the data file exists.")
         return None, None
 
-    # Apply gas price multiplier from config
-    if 'Gas_Price' in full_data.columns:
-        full_data['Gas_Price'] *= config.GAS_PRICE_MULTIPLIER
-    
-    # --- Typical Day Selection (Simplified Method) ---
-    # This is a simplified placeholder for a more advanced clustering algorithm like tsam.
-    # It selects days evenly spaced throughout the year.
+    if cache_key in _LOADED_TYPICAL_DAYS:
+        return _LOADED_TYPICAL_DAYS[cache_key]
+
+    cache_path = os.path.join(TYPICAL_DAYS_CACHE_DIR, f"{cache_key}.npz")
+    if os.path.exists(cache_path):
+        try:
+            with np.load(cache_path, allow_pickle=False) as cached:
+                index = pd.Index(cached['index'], name=str(cached['index_name']))
+                typical_days_data = pd.DataFrame(cached['values'], index=index, columns=cached['columns'].tolist())
+                day_weights = cached['day_weights']
+        except Exception as e:
+            print(f"Ignoring unreadable typical-days cache {cache_path}: {e}")
+        else:
+            print(f"Loaded {len(day_weights)} representative days from cache: {cache_path}")
+            _LOADED_TYPICAL_DAYS[cache_key] = typical_days_data, day_weights
+            return typical_days_data, day_weights
+
+    typical_days_data, day_weights = _select_typical_days_data()
+    _save_typical_days(cache_path, typical_days_data, day_weights)
+    _LOADED_TYPICAL_DAYS[cache_key] = typical_days_data, day_weights
+    return typical_days_data, day_weights
+
+def _save_typical_days(cache_path: str, typical_days_data: pd.DataFrame, day_weights: np.ndarray):
+    """
+    Writes a typical-day selection to cache_path.
+    """
+    utils.write_cache_file(cache_path, lambda f: np.savez(
+        f,
+        values=typical_days_data.to_numpy(),
+        index=typical_days_data.index.to_numpy(),
+        index_name=str(typical_days_data.index.name),
+        columns=np.asarray(typical_days_data.columns, dtype=str),
+        day_weights=day_weights))
+
+def _select_typical_days_data():
+    """Reads the full data file and selects the typical days, bypassing the cache."""
+    # Load the full 365-day time series data
+    full_data = pd.read_csv(DATA_PATH, index_col=0, dtype=DATA_DTYPES, engine='c')
+
+    # Note: config.GAS_PRICE_MULTIPLIER is applied by run_analysis.py when it forms the
+    # gas cost coefficients, so the raw prices are left untouched here.
+
+    # --- Typical Day Selection (k-means clustering) ---
+    # Days are clustered on their 24-hour profiles of every input series; the day closest
+    # to each cluster centre represents that cluster.
     num_total_days = len(full_data) // 24
     num_typical_days = config.NUM_DAYS
 
     if num_typical_days > num_total_days:
         raise ValueError(f"NUM_DAYS ({num_typical_days}) cannot be greater than the total number of days in the dataset ({num_total_days}).")
 
+    daily_profiles = full_data.iloc[:num_total_days * 24].to_numpy(dtype=float).reshape(num_total_days, -1)
+    day_indices, cluster_sizes = select_typical_days(daily_profiles, num_typical_days)
+
     # Get the corresponding hourly indices for the selected days
-    day_indices = np.linspace(0, num_total_days - 1, num_typical_days, dtype=int)
-    hour_indices = []
-    for day_idx in day_indices:
-        hour_indices.extend(range(day_idx * 24, (day_idx + 1) * 24))
+    hour_indices = (day_indices[:, None] * 24 + np.arange(24)[None, :]).ravel()
 
     typical_days_data = full_data.iloc[hour_indices].copy()
 
     # --- Calculate Weights ---
-    # In this simplified method, each selected day represents an equal number of days from the year.
-    # The total weight should sum to the total number of days in the year.
-    weight = num_total_days / num_typical_days
-    day_weights = np.full(num_typical_days, weight)
+    # Each selected day stands in for every day of its cluster, so the weights
+    # sum to the total number of days in the year.
+    day_weights = cluster_sizes.astype(float)
 
-    print(f"Selected {num_typical_days} representative days from {num_total_days} total days.")
-    print(f"Each representative day has a weight of: {weight:.2f}")
+    print(f"Selected {len(day_indices)} representative days from {num_total_days} total days.")
+    print(f"Representative day weights range from {day_weights.min():.0f} to {day_weights.max():.0f} days.")
 
     return typical_days_data, day_weights
 
@@ -5,12 +5,24 @@
 # Unauthorized use, copying, or distribution of this code is strictly prohibited.
 
 
+import functools
+import hashlib
+import json
+import os
+import pickle
+
 import sympy
 
 import config
+import utils
 from pymeshub.graph.builder import GraphEnergyHub
 from pymeshub.components.base import Component
 
+@functools.lru_cache(maxsize=256, typed=True)
+def _cached_sympify(value):
+    """sympy.sympify memoized on the (hashable) input; a sweep sees few distinct COPs."""
+    return sympy.sympify(value)
+
 # --- Custom Component Definition ---
 class ElectricChiller(Component):
     """
@@ -19,9 +31,10 @@ class ElectricChiller(Component):
     """
     def __init__(self, name: str, cop: sympy.Expr):
         super().__init__(name)
-        self.set_parameter('cop', sympy.sympify(cop))
+        self.set_parameter('cop', _cached_sympify(cop))
         self.add_input_port('elec_in', 0)
         self.add_output_port('cool_out', 1)
+        self._characteristic_matrix = None
 
     def get_port_branch_matrix(self) -> sympy.Matrix:
         return sympy.Matrix([[1, 0], [0, -1]])
@@ -29,23 +42,124 @@ class ElectricChiller(Component):
     def get_characteristic_matrix(self) -> sympy.Matrix:
         cop = self.get_parameter('cop')
         # Equation: cop * V_elec_in - V_cool_out = 0
-        return sympy.Matrix([[cop, -1]])
+        # Built once and reused; immutable since the same instance is handed out each call.
+        if self._characteristic_matrix is None or self._characteristic_matrix[0, 0] != cop:
+            self._characteristic_matrix = sympy.ImmutableMatrix([[cop, -1]])
+        return self._characteristic_matrix
+
+class EnergyBus(Component):
+    """
+    Energy Bus: A lossless node that collects the producer ports of one energy carrier
+    and distributes the energy to its consumer ports.
+    Each connected port gets its own bus port, so every branch maps to exactly one port.
+    """
+    def __init__(self, name: str, inputs: list, outputs: list):
+        super().__init__(name)
+        for i, port_name in enumerate(inputs):
+            self.add_input_port(port_name, i)
+        for j, port_name in enumerate(outputs):
+            self.add_output_port(port_name, len(inputs) + j)
+
+    def get_port_branch_matrix(self) -> sympy.Matrix:
+        return sympy.diag(*([1] * len(self.input_ports) + [-1] * len(self.output_ports)))
+
+    def get_characteristic_matrix(self) -> sympy.Matrix:
+        # Equation: sum(V_in) - sum(V_out) = 0
+        return sympy.Matrix([[1] * len(self.input_ports) + [-1] * len(self.output_ports)])
+
+def _connect_bus(graph_hub: GraphEnergyHub, bus_name: str, producers: tuple, consumers: tuple, storage_node: str):
+    """
+    Adds an EnergyBus and connects producers, consumers and a storage unit through it.
+
+    This needs len(producers) + len(consumers) + 2 branches instead of the
+    len(producers) * len(consumers) of a direct bipartite connection.
+    """
+    sources = producers + ((storage_node, 'energy_out'),)
+    sinks = consumers + ((storage_node, 'energy_in'),)
+    graph_hub.add_component(bus_name, 'EnergyBus',
+                            inputs=[f"{node}_{port}" for node, port in sources],
+                            outputs=[f"{node}_{port}" for node, port in sinks])
+    for node, port in sources:
+        graph_hub.connect(node, port, bus_name, f"{node}_{port}")
+    for node, port in sinks:
+        graph_hub.connect(bus_name, f"{node}_{port}", node, port)
+
+# --- Bus Connection Lists: (node, port) pairs on each energy bus ---
+_GAS_CONSUMERS = ('CHP_A', 'CHP_B', 'ICE', 'Gas_Boiler')
+_ELEC_PRODUCERS = (('Elec_Import', 'out'), ('CHP_A', 'elec_out'), ('CHP_B', 'elec_out'), ('ICE', 'elec_out'))
+_ELEC_CONSUMERS = (('Elec_Boiler', 'elec_in'), ('Heat_Pump_A', 'elec_in'), ('Heat_Pump_B', 'elec_in'),
+                   ('CERG_A', 'elec_in'), ('CERG_B', 'elec_in'), ('Elec_Load', 'in'))
+_HEAT_PRODUCERS = (('Gas_Boiler', 'heat_out'), ('Elec_Boiler', 'heat_out'),
+                   ('CHP_A', 'heat_out'), ('CHP_B', 'heat_out'), ('ICE', 'heat_out'),
+                   ('Heat_Pump_A', 'heat_out'), ('Heat_Pump_B', 'heat_out'))
+_HEAT_CONSUMERS = (('WARP', 'heat_in'), ('Heat_Load', 'in'))
+_COOL_PRODUCERS = (('WARP', 'cool_out'), ('CERG_A', 'cool_out'), ('CERG_B', 'cool_out'))
+_COOL_CONSUMERS = (('Cooling_Load', 'in'),)
+
+# Directory for pickled EnergyHub builds, keyed by the component parameters.
+HUB_CACHE_DIR = '.mes_hub_cache'
+
+def _hub_cache_key() -> str:
+    """
+    Returns a key identifying the hub that build_mes_model would produce.
+
+    The key covers the component parameters from the config and the modification time
+    of this file, so editing the topology below invalidates earlier builds.
+    """
+    payload = json.dumps(config.COMPONENT_PARAMS, sort_keys=True) + str(os.path.getmtime(__file__))
+    return hashlib.sha1(payload.encode()).hexdigest()
 
 def build_mes_model():
     """
     Builds the Multi-Energy System (MES) model based on the provided architecture diagram.
     
-    This function uses the GraphEnergyHub to define and connect all components
-    of the energy hub.
+    The symbolic build is cached on disk in HUB_CACHE_DIR; parameter sweeps that leave
+    the component parameters unchanged reuse the pickled hub instead of rebuilding it.
     
     Returns:
         EnergyHub: A compiled EnergyHub object containing the system matrices.
     """
     print("--- Building MES Model from Architecture Diagram ---")
 
+    cache_path = os.path.join(HUB_CACHE_DIR, f"{_hub_cache_key()}.pkl")
+    hub = None
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                hub = pickle.load(f)
+            print(f"Loaded cached EnergyHub from {cache_path}")
+        except Exception as e:
+            print(f"Ignoring unreadable hub cache {cache_path}: {e}")
+
+    if hub is None:
+        hub = _build_graph_hub().build()
+        utils.write_cache_file(cache_path, lambda f: pickle.dump(hub, f))
+
+    # Retrieve and print the system matrices
+    X, Y, Z = hub.get_system_matrices()
+
+    print("\n--- Generated Matrices from Graph Build ---")
+    print(f"X Matrix (Input Incidence) shape: {X.shape}")
+    # print(X)
+    print(f"\nY Matrix (Output Incidence) shape: {Y.shape}")
+    # print(Y)
+    print(f"\nZ Matrix (System Energy Conversion) shape: {Z.shape}")
+    # print(Z)
+    
+    print("\n--- MES Model Build Complete ---")
+    return hub
+
+def _build_graph_hub() -> GraphEnergyHub:
+    """
+    Defines and connects all components of the energy hub in a GraphEnergyHub.
+
+    Returns:
+        GraphEnergyHub: The connected graph, ready to be built into an EnergyHub.
+    """
     # 1. Create a GraphEnergyHub instance and register the custom component
     graph_hub = GraphEnergyHub("MES_from_diagram")
     graph_hub._component_types['ElectricChiller'] = ElectricChiller # Manual registration as per docs
+    graph_hub._component_types['EnergyBus'] = EnergyBus
 
     # 2. Define IO Nodes (Inputs and Loads)
     # Inputs
@@ -58,98 +172,50 @@ def build_mes_model():
 
     # 3. Define Components with parameters from config
     # The component parameters (eta, cop) are now taken from config.py
-    graph_hub.add_component('CHP_A', 'CHPBackPressure', **config.COMPONENT_PARAMS['CHP_A'])
-    graph_hub.add_component('CHP_B', 'CHPBackPressure', **config.COMPONENT_PARAMS['CHP_B'])
-    graph_hub.add_component('ICE', 'CHPBackPressure', **config.COMPONENT_PARAMS['ICE'])
-    graph_hub.add_component('Gas_Boiler', 'Boiler', **config.COMPONENT_PARAMS['Gas_Boiler'])
-    graph_hub.add_component('Elec_Boiler', 'ElectricBoiler', **config.COMPONENT_PARAMS['Elec_Boiler'])
-    graph_hub.add_component('Heat_Pump_A', 'HeatPump', **config.COMPONENT_PARAMS['Heat_Pump_A'])
-    graph_hub.add_component('Heat_Pump_B', 'HeatPump', **config.COMPONENT_PARAMS['Heat_Pump_B'])
-    graph_hub.add_component('CERG_A', 'ElectricChiller', **config.COMPONENT_PARAMS['CERG_A'])
-    graph_hub.add_component('CERG_B', 'ElectricChiller', **config.COMPONENT_PARAMS['CERG_B'])
-    graph_hub.add_component('WARP', 'AbsorptionChiller', **config.COMPONENT_PARAMS['WARP'])
-    graph_hub.add_component('Elec_Storage', 'Storage', **config.COMPONENT_PARAMS['Elec_Storage'])
-    graph_hub.add_component('Heat_Storage', 'Storage', **config.COMPONENT_PARAMS['Heat_Storage'])
-    graph_hub.add_component('Cooling_Storage', 'Storage', **config.COMPONENT_PARAMS['Cooling_Storage'])
-
-
-
-    # 4. Connect the graph based on the four energy buses (Acyclic Logic)
+    params = config.COMPONENT_PARAMS
+    graph_hub.add_component('CHP_A', 'CHPBackPressure', **params['CHP_A'])
+    graph_hub.add_component('CHP_B', 'CHPBackPressure', **params['CHP_B'])
+    graph_hub.add_component('ICE', 'CHPBackPressure', **params['ICE'])
+    graph_hub.add_component('Gas_Boiler', 'Boiler', **params['Gas_Boiler'])
+    graph_hub.add_component('Elec_Boiler', 'ElectricBoiler', **params['Elec_Boiler'])
+    graph_hub.add_component('Heat_Pump_A', 'HeatPump', **params['Heat_Pump_A'])
+    graph_hub.add_component('Heat_Pump_B', 'HeatPump', **params['Heat_Pump_B'])
+    graph_hub.add_component('CERG_A', 'ElectricChiller', **params['CERG_A'])
+    graph_hub.add_component('CERG_B', 'ElectricChiller', **params['CERG_B'])
+    graph_hub.add_component('WARP', 'AbsorptionChiller', **params['WARP'])
+    graph_hub.add_component('Elec_Storage', 'Storage', **params['Elec_Storage'])
+    graph_hub.add_component('Heat_Storage', 'Storage', **params['Heat_Storage'])
+    graph_hub.add_component('Cooling_Storage', 'Storage', **params['Cooling_Storage'])
+
+
+
+    # 4. Connect the graph based on the four energy buses
+    # The electricity, heating and cooling buses are EnergyBus nodes. Storage both charges
+    # from and discharges into its bus, so the graph is no longer acyclic.
     
     # --- Natural Gas Bus Connections ---
-    for comp in ['CHP_A', 'CHP_B', 'ICE', 'Gas_Boiler']:
+    # A single producer feeds the gas consumers, so direct branches are already minimal.
+    for comp in _GAS_CONSUMERS:
         graph_hub.connect('Gas_Import', 'out', comp, 'fuel_in')
 
-    # --- Electricity Bus Connections (Acyclic) ---
-    elec_producers = [('Elec_Import', 'out'), ('CHP_A', 'elec_out'), ('CHP_B', 'elec_out'), ('ICE', 'elec_out')]
-    elec_consumers = [('Elec_Boiler', 'elec_in'), ('Heat_Pump_A', 'elec_in'), ('Heat_Pump_B', 'elec_in'),
-                      ('CERG_A', 'elec_in'), ('CERG_B', 'elec_in'), ('Elec_Load', 'in')]
-    elec_storage_node = 'Elec_Storage'
-    # Connect producers to consumers
-    for p_node, p_port in elec_producers:
-        for c_node, c_port in elec_consumers:
-            graph_hub.connect(p_node, p_port, c_node, c_port)
-    # Connect producers to storage (charging)
-    for p_node, p_port in elec_producers:
-        graph_hub.connect(p_node, p_port, elec_storage_node, 'energy_in')
-    # Connect storage to consumers (discharging)
-    for c_node, c_port in elec_consumers:
-        graph_hub.connect(elec_storage_node, 'energy_out', c_node, c_port)
-
-    # --- Heating Bus Connections (Acyclic) ---
-    heat_producers = [('Gas_Boiler', 'heat_out'), ('Elec_Boiler', 'heat_out'), 
-                      ('CHP_A', 'heat_out'), ('CHP_B', 'heat_out'), ('ICE', 'heat_out'),
-                      ('Heat_Pump_A', 'heat_out'), ('Heat_Pump_B', 'heat_out')]
-    heat_consumers = [('WARP', 'heat_in'), ('Heat_Load', 'in')]
-    heat_storage_node = 'Heat_Storage'
-    # Connect producers to consumers
-    for p_node, p_port in heat_producers:
-        for c_node, c_port in heat_consumers:
-            graph_hub.connect(p_node, p_port, c_node, c_port)
-    # Connect producers to storage (charging)
-    for p_node, p_port in heat_producers:
-        graph_hub.connect(p_node, p_port, heat_storage_node, 'energy_in')
-    # Connect storage to consumers (discharging)
-    for c_node, c_port in heat_consumers:
-        graph_hub.connect(heat_storage_node, 'energy_out', c_node, c_port)
-
-    # --- Cooling Bus Connections (Acyclic) ---
-    cool_producers = [('WARP', 'cool_out'), ('CERG_A', 'cool_out'), ('CERG_B', 'cool_out')]
-    cool_consumers = [('Cooling_Load', 'in')]
-    cool_storage_node = 'Cooling_Storage'
-    # Connect producers to consumers
-    for p_node, p_port in cool_producers:
-        for c_node, c_port in cool_consumers:
-            graph_hub.connect(p_node, p_port, c_node, c_port)
-    # Connect producers to storage (charging)
-    for p_node, p_port in cool_producers:
-        graph_hub.connect(p_node, p_port, cool_storage_node, 'energy_in')
-    # Connect storage to consumers (discharging)
-    for c_node, c_port in cool_consumers:
-        graph_hub.connect(cool_storage_node, 'energy_out', c_node, c_port)
+    # --- Electricity Bus Connections ---
+    _connect_bus(graph_hub, 'Elec_Bus', _ELEC_PRODUCERS, _ELEC_CONSUMERS, 'Elec_Storage')
+
+    # --- Heating Bus Connections ---
+    _connect_bus(graph_hub, 'Heat_Bus', _HEAT_PRODUCERS, _HEAT_CONSUMERS, 'Heat_Storage')
+
+    # --- Cooling Bus Connections ---
+    _connect_bus(graph_hub, 'Cooling_Bus', _COOL_PRODUCERS, _COOL_CONSUMERS, 'Cooling_Storage')
 
     # 5. Visualize the graph topology (optional, but good for verification)
+    # Note: visualize() lays out nodes with a topological sort and needs an acyclic graph.
     print("Visualizing the energy hub graph...")
     # graph_hub.visualize()
     print("Graph visualization saved to 'energy_hub_graph.png'")
 
-    # 6. Build the EnergyHub instance to get the matrices
-    hub = graph_hub.build()
-
-    # 7. Retrieve and print the system matrices
-    X, Y, Z = hub.get_system_matrices()
-
-    print("\n--- Generated Matrices from Graph Build ---")
-    print(f"X Matrix (Input Incidence) shape: {X.shape}")
-    # print(X)
-    print(f"\nY Matrix (Output Incidence) shape: {Y.shape}")
-    # print(Y)
-    print(f"\nZ Matrix (System Energy Conversion) shape: {Z.shape}")
-    # print(Z)
-    
-    print("\n--- MES Model Build Complete ---")
-    return hub
+    return graph_hub
 
 if __name__ == "__main__":
+    config.load_config('configs/1_baseline.yaml')
     mes_hub = build_mes_model()
     # You can now use the 'mes_hub' object for further analysis or optimization.
\ No newline at end of file
@@ -0,0 +1,50 @@
+# Copyright (c) 2025 VerNe.
+# All rights reserved.
+#
+# This code is for personal academic use only.
+# Unauthorized use, copying, or distribution of this code is strictly prohibited.
+
+"""
+Numba-compiled kernels for the MES data pipeline.
+
+Numba is optional: HAS_NUMBA is False when it is not installed, and callers fall back
+to their NumPy implementations. The kernels are compiled with cache=True, so only the
+first run after a code change pays the JIT compilation cost.
+"""
+import numpy as np
+
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+if HAS_NUMBA:
+    @njit(cache=True)
+    def assign_and_score(X, centroids, out_labels, out_dists):
+        """
+        Assigns each row of X to its nearest centroid by squared Euclidean distance.
+
+        Serial on purpose: at 365 days a thread pool costs more than the work, and a
+        threading layer started in a sweep's parent process hangs its forked workers.
+
+        Args:
+            X: Array of shape (num_rows, num_features).
+            centroids: Array of shape (num_clusters, num_features).
+            out_labels: Int array of length num_rows, filled with the nearest centroid index.
+            out_dists: Float array of length num_rows, filled with the squared distance to it.
+        """
+        num_rows, num_features = X.shape
+        for i in range(num_rows):
+            best_label = 0
+            best_dist = np.inf
+            for k in range(centroids.shape[0]):
+                dist = 0.0
+                for j in range(num_features):
+                    diff = X[i, j] - centroids[k, j]
+                    dist += diff * diff
+                if dist < best_dist:
+                    best_dist = dist
+                    best_label = k
+            out_labels[i] = best_label
+            out_dists[i] = best_dist
@@ -14,8 +14,6 @@ It creates two main visualizations:
    plotting gas import volume against gas price and investment cost multipliers.
 '''
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 import os
 
 # --- Configuration ---
@@ -24,23 +22,65 @@ OUTPUT_DIR = 'plots'
 DAYS_SWEEP_FILE = os.path.join(RESULTS_DIR, 'days_sweep_results.csv')
 GAS_SWEEP_FILE = os.path.join(RESULTS_DIR, 'gas_viability_sweep_results.csv')
 
+# Figures kept between calls, keyed by plot name (see _reusable_figure)
+_FIGURES = {}
+
 # --- Helper Functions ---
 def ensure_dir(directory):
     """Creates a directory if it does not exist."""
     if not os.path.exists(directory):
         os.makedirs(directory)
 
+def read_results_csv(path):
+    """
+    Reads a sweep results CSV, using pyarrow's multithreaded reader when it is installed.
+    Columns keep NumPy dtypes so matplotlib and seaborn handle them as before.
+    """
+    try:
+        return pd.read_csv(path, engine='pyarrow')
+    except ImportError:
+        return pd.read_csv(path)
+
+def _pyplot():
+    """
+    Imports pyplot on the non-interactive Agg backend.
+    Imported lazily; plotting deps are slow to import and only the PNGs are needed.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+def _reusable_figure(name, figsize):
+    """
+    Returns a cleared figure for the named plot, creating it on first use.
+
+    The figure is made current so that pyplot-level calls draw onto it, and it is kept
+    open so that repeated calls (e.g. one per sweep variant) skip figure construction.
+    """
+    plt = _pyplot()
+    fig = _FIGURES.get(name)
+    if fig is None:
+        fig = _FIGURES[name] = plt.figure(figsize=figsize)
+    else:
+        fig.clf()
+        plt.figure(fig.number)
+    return fig
+
 def plot_days_sweep_analysis():
     """Generates and saves the plot for the typical days analysis."""
+    plt = _pyplot()
+
     print(f"--- Generating plot for: {DAYS_SWEEP_FILE} ---")
     if not os.path.exists(DAYS_SWEEP_FILE):
         print(f"ERROR: File not found - {DAYS_SWEEP_FILE}")
         return
 
-    df = pd.read_csv(DAYS_SWEEP_FILE)
+    df = read_results_csv(DAYS_SWEEP_FILE)
     df = df.sort_values(by='num_days').reset_index()
 
-    fig, ax1 = plt.subplots(figsize=(12, 7))
+    fig = _reusable_figure('days_sweep', figsize=(12, 7))
+    ax1 = fig.add_subplot()
 
     # Plot Total Annual Cost on the left y-axis
     color = 'tab:blue'
@@ -71,31 +111,33 @@ def plot_days_sweep_analysis():
     output_path = os.path.join(OUTPUT_DIR, 'days_sweep_analysis.png')
     plt.savefig(output_path, dpi=300, bbox_inches='tight')
     print(f"Plot saved to {output_path}")
-    plt.close()
 
 def plot_gas_viability_heatmap():
     """Generates and saves the heatmap for the gas viability analysis."""
+    plt = _pyplot()
+    import seaborn as sns
+
     print(f"\n--- Generating heatmap for: {GAS_SWEEP_FILE} ---")
     if not os.path.exists(GAS_SWEEP_FILE):
         print(f"ERROR: File not found - {GAS_SWEEP_FILE}")
         return
 
-    df = pd.read_csv(GAS_SWEEP_FILE)
+    df = read_results_csv(GAS_SWEEP_FILE)
 
     # Pivot the data to create a matrix for the heatmap
     # We use gas import as the value to color the cells
-    df['gas_import_1e5_mwh'] = df['gas_import_mwh'] / 1e5 # Scale down the data
-    heatmap_data = df.pivot_table(
+    # Each (invest, price) pair is a single sweep point, so a plain pivot suffices (no aggregation)
+    heatmap_data = df.pivot(
         index='gas_invest_multiplier',
         columns='gas_price_multiplier',
-        values='gas_import_1e5_mwh' # Use the scaled data for values
-    )
+        values='gas_import_mwh'
+    ) / 1e5 # Scale down the data
     # Sort the axes for a correct representation
-    heatmap_data = heatmap_data.sort_values(by='gas_invest_multiplier', ascending=False)
-    heatmap_data = heatmap_data.sort_values(by='gas_price_multiplier', axis=1, ascending=True)
+    heatmap_data = heatmap_data.reindex(index=sorted(heatmap_data.index, reverse=True),
+                                        columns=sorted(heatmap_data.columns))
+
+    _reusable_figure('gas_viability_heatmap', figsize=(12, 9))
 
-    plt.figure(figsize=(12, 9))
-    
     # Create the heatmap using seaborn
     sns.heatmap(
         heatmap_data,
@@ -118,7 +160,6 @@ def plot_gas_viability_heatmap():
     output_path = os.path.join(OUTPUT_DIR, 'gas_viability_heatmap.png')
     plt.savefig(output_path, dpi=300, bbox_inches='tight')
     print(f"Plot saved to {output_path}")
-    plt.close()
 
 if __name__ == "__main__":
     ensure_dir(OUTPUT_DIR)
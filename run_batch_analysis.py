@@ -23,12 +23,38 @@ import pandas as pd
 import time
 import re
 import copy
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import config
+import run_analysis
+from data_loader import load_and_prepare_data
+from mes_model import build_mes_model
 from run_analysis import run_optimization
 
 # --- Configuration ---
 BASELINE_CONFIG_PATH = 'configs/1_baseline.yaml'
 TEMP_CONFIG_DIR = 'configs/temp'
 RESULTS_DIR = 'batch_results'
+# Gurobi threads per gas-sweep worker; the sweep runs os.cpu_count() // this many workers
+GAS_SWEEP_GUROBI_THREADS = 2
+
+# Prefer the libyaml-backed loader/dumper; fall back to the pure-Python ones if unavailable.
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+_YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+
+# Summary-file metrics, compiled once: result key -> pattern whose group(1) is the value
+_SUMMARY_PATTERNS = {
+    'total_annual_cost': re.compile(r"Total Annual Cost: ([\d,.-]+)"),
+    'investment_cost': re.compile(r"Annualized Investment Cost: ([\d,.-]+)"),
+    'operational_cost': re.compile(r"Total Annual Operational Cost: ([\d,.-]+)"),
+    'gas_import_mwh': re.compile(r"Total Gas Import: ([\d,.-]+)"),
+    'elec_import_mwh': re.compile(r"Total Elec Import: ([\d,.-]+)"),
+    'solve_time': re.compile(r"Solve Time: ([\d,.-]+)s"),
+}
+# Invested capacity of the gas-fired components
+_GAS_CAPACITY_PATTERN = re.compile(r"(?:CHP_A|CHP_B|ICE|Gas_Boiler): \d+ units? => Capacity: ([\d,.-]+) MW")
 
 
 # --- Helper Functions ---
@@ -38,6 +64,14 @@ def ensure_dir(directory):
         os.makedirs(directory)
 
 
+def _parse_number(value_str):
+    """Converts a matched number such as '1,234.5' to float, or 0.0 if it is malformed."""
+    try:
+        return float(value_str.replace(',', ''))
+    except ValueError:
+        return 0.0
+
+
 def parse_summary_file(file_path):
     """
     Parses a summary.txt file to extract key metrics.
@@ -55,28 +89,19 @@ def parse_summary_file(file_path):
         results['error'] = f'Could not read file: {e}'
         return results
 
-    def find_value(pattern, text):
-        match = re.search(pattern, text)
-        if not match:
-            return 0.0
-        try:
-            value_str = match.group(1).replace(',', '')
-            return float(value_str)
-        except (ValueError, IndexError):
-            return 0.0
-
-    results['total_annual_cost'] = find_value(r"Total Annual Cost: ([\d,.-]+)", content)
-    results['investment_cost'] = find_value(r"Annualized Investment Cost: ([\d,.-]+)", content)
-    results['operational_cost'] = find_value(r"Total Annual Operational Cost: ([\d,.-]+)", content)
-    results['gas_import_mwh'] = find_value(r"Total Gas Import: ([\d,.-]+)", content)
-    results['elec_import_mwh'] = find_value(r"Total Elec Import: ([\d,.-]+)", content)
-    results['solve_time'] = find_value(r"Total Time: ([\d,.-]+)s", content)
-
-    gas_invest_cap = 0
-    gas_components = ['CHP_A', 'CHP_B', 'ICE', 'Gas_Boiler']
-    for comp in gas_components:
-        pattern = comp + r": \d+ units? => Capacity: ([\d,.-]+) MW"
-        gas_invest_cap += find_value(pattern, content)
+    # Single pass over the lines; the first match of each metric wins, missing metrics are 0.0
+    values = {}
+    for line in content.splitlines():
+        for key, pattern in _SUMMARY_PATTERNS.items():
+            if key not in values:
+                match = pattern.search(line)
+                if match:
+                    values[key] = _parse_number(match.group(1))
+                    break
+    for key in _SUMMARY_PATTERNS:
+        results[key] = values.get(key, 0.0)
+
+    gas_invest_cap = sum(_parse_number(value) for value in _GAS_CAPACITY_PATTERN.findall(content))
     results['gas_invested_capacity_mw'] = gas_invest_cap
     return results
 
@@ -91,7 +116,7 @@ def run_days_sweep():
 
     try:
         with open(BASELINE_CONFIG_PATH, 'r', encoding='utf-8') as f:
-            base_config = yaml.safe_load(f)
+            base_config = yaml.load(f, Loader=_YAML_LOADER)
     except Exception as e:
         print(f"FATAL: Could not read baseline config: {e}")
         return
@@ -105,7 +130,7 @@ def run_days_sweep():
 
         try:
             with open(temp_config_path, 'w', encoding='utf-8') as f:
-                yaml.dump(temp_config, f)
+                yaml.dump(temp_config, f, Dumper=_YAML_DUMPER)
 
             run_optimization(temp_config_path)
 
@@ -123,18 +148,56 @@ def run_days_sweep():
         print(f"\nDays sweep analysis complete. Results saved to {output_path}")
 
 
+def _init_gas_worker(gurobi_threads):
+    """Limits the Gurobi threads of a gas-sweep worker process."""
+    run_analysis.GUROBI_THREADS = gurobi_threads
+
+
+def _run_gas_scenario(p_mult, i_mult, base_config, original_gas_investments):
+    """
+    Runs a single point of the gas viability sweep and returns its parsed results.
+    Returns None if the scenario failed.
+    """
+    scenario_name = f"gas_p{int(p_mult * 100)}_i{int(i_mult * 100)}"
+    print(f"--- Running scenario: {scenario_name}")
+    temp_config = copy.deepcopy(base_config)
+    temp_config['economic_parameters']['gas_price_multiplier'] = p_mult
+
+    for device, original_cost in original_gas_investments.items():
+        if device in temp_config['investment_costs']:
+            temp_config['investment_costs'][device] = original_cost * i_mult
+
+    temp_config_path = os.path.join(TEMP_CONFIG_DIR, f"{scenario_name}.yaml")
+
+    try:
+        with open(temp_config_path, 'w', encoding='utf-8') as f:
+            yaml.dump(temp_config, f, Dumper=_YAML_DUMPER)
+        run_optimization(temp_config_path)
+        summary_path = os.path.join('results', f"{scenario_name}_summary.txt")
+        result = parse_summary_file(summary_path)
+        result['gas_price_multiplier'] = p_mult
+        result['gas_invest_multiplier'] = i_mult
+        return result
+    except Exception as e:
+        print(f"ERROR running scenario {scenario_name}: {e}")
+        return None
+
+
 def run_gas_viability_sweep():
     """
     Runs the analysis for Question 5: Gas price and investment cost sweep.
+
+    The grid points are independent, so they are solved in parallel worker processes.
+    Only prices and investment costs vary, so each worker builds the problem once and
+    later points only update its Parameters (see run_analysis._PROBLEM_CACHE).
     """
     print("\n>>> Starting Batch Analysis: Gas Viability (2D Sweep)")
     gas_price_multipliers = [1.0, 0.9, 0.8,0.7, 0.6, 0.5, 0.4,0.3, 0.2, 0.1, 0]
     gas_invest_multipliers = [1.0, 0.9, 0.8,0.7, 0.6, 0.5, 0.4,0.3, 0.2, 0.1, 0]
-    all_results = []
 
     try:
         with open(BASELINE_CONFIG_PATH, 'r', encoding='utf-8') as f:
-            base_config = yaml.safe_load(f)
+            base_config = yaml.load(f, Loader=_YAML_LOADER)
     except Exception as e:
         print(f"FATAL: Could not read baseline config: {e}")
         return
@@ -146,30 +209,27 @@ def run_gas_viability_sweep():
         'Gas_Boiler': base_config['investment_costs']['Gas_Boiler'],
     }
 
-    for p_mult in gas_price_multipliers:
-        for i_mult in gas_invest_multipliers:
-            scenario_name = f"gas_p{int(p_mult * 100)}_i{int(i_mult * 100)}"
-            print(f"--- Running scenario: {scenario_name}")
-            temp_config = copy.deepcopy(base_config)
-            temp_config['economic_parameters']['gas_price_multiplier'] = p_mult
-
-            for device, original_cost in original_gas_investments.items():
-                if device in temp_config['investment_costs']:
-                    temp_config['investment_costs'][device] = original_cost * i_mult
-
-            temp_config_path = os.path.join(TEMP_CONFIG_DIR, f"{scenario_name}.yaml")
-
-            try:
-                with open(temp_config_path, 'w', encoding='utf-8') as f:
-                    yaml.dump(temp_config, f)
-                run_optimization(temp_config_path)
-                summary_path = os.path.join('results', f"{scenario_name}_summary.txt")
-                result = parse_summary_file(summary_path)
-                result['gas_price_multiplier'] = p_mult
-                result['gas_invest_multiplier'] = i_mult
-                all_results.append(result)
-            except Exception as e:
-                print(f"ERROR running scenario {scenario_name}: {e}")
+    # Fill the on-disk hub and typical-day caches once, so that the workers only load them
+    config.load_config(BASELINE_CONFIG_PATH)
+    build_mes_model()
+    load_and_prepare_data()
+
+    scenarios = [(p_mult, i_mult) for p_mult in gas_price_multipliers for i_mult in gas_invest_multipliers]
+    max_workers = max(1, os.cpu_count() // GAS_SWEEP_GUROBI_THREADS)
+    # Workers are started from a clean server process rather than forked from this one, which
+    # may hold thread pools (BLAS, solvers) that do not survive a fork. They load the hub and
+    # typical days from the disk caches filled above.
+    mp_context = multiprocessing.get_context('forkserver') \
+        if 'forkserver' in multiprocessing.get_all_start_methods() else None
+    results = [None] * len(scenarios)  # Kept in grid order, whatever the completion order
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context, initializer=_init_gas_worker,
+                             initargs=(GAS_SWEEP_GUROBI_THREADS,)) as executor:
+        futures = {executor.submit(_run_gas_scenario, p_mult, i_mult, base_config, original_gas_investments): k
+                   for k, (p_mult, i_mult) in enumerate(scenarios)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            results[futures[future]] = future.result()
+            print(f"--- Gas sweep progress: {done}/{len(scenarios)} scenarios finished")
+    all_results = [result for result in results if result is not None]
 
     if all_results:
         results_df = pd.DataFrame(all_results)
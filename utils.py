@@ -7,7 +7,10 @@
 """
 Utility functions for the MES optimization project.
 """
+import os
+from functools import lru_cache
 
+@lru_cache(maxsize=None)
 def calculate_annuity_factor(interest_rate: float, lifetime: int) -> float:
     """
     Calculates the annuity factor (also known as Capital Recovery Factor, CRF).
@@ -22,6 +25,8 @@ def calculate_annuity_factor(interest_rate: float, lifetime: int) -> float:
 
     Returns:
         The annuity factor.
+
+    Results are memoized; sweeps only ever use a handful of (rate, lifetime) pairs.
     """
     if lifetime == 0:
         return 1 # Avoid division by zero; implies full cost is borne in one year
@@ -32,4 +37,32 @@ def calculate_annuity_factor(interest_rate: float, lifetime: int) -> float:
     n = lifetime
     return (i * (1 + i)**n) / ((1 + i)**n - 1)
 
-print("Utility file 'utils.py' created successfully.")
\ No newline at end of file
+def write_cache_file(path: str, write) -> bool:
+    """
+    Writes a cache file under a temporary name and moves it into place.
+
+    A failed or interrupted write therefore never leaves a truncated entry at path, and
+    parallel sweep workers writing the same entry cannot interleave. Any error is reported
+    and only means the entry is not cached.
+
+    Args:
+        path: The cache file to write. Its directory is created if needed.
+        write: Called with the open binary file object to write the contents.
+
+    Returns:
+        True if the entry was written.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+        return True
+    except Exception as e:
+        print(f"Could not write cache file {path}: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False